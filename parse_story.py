@@ -1,19 +1,93 @@
 
+import codecs
 import os
 import re
-import json
+import string
+import orjson
 import requests
 import argparse
-from bs4 import BeautifulSoup
+from bisect import bisect_right
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree, html
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, pairwise
 from datetime import datetime
+import queue
 import subprocess
+import threading
 
 LIBRARY_PATH = "./library.json"
 CONTENT_DIR = "./content"
+USER_AGENT = "ChatGPT-Code story parser (+https://github.com/Aterkulve/ChatGPT-Code)"
+REQUEST_TIMEOUT = (5, 30)
+
+_SESSION = requests.Session()
+_SESSION.headers["User-Agent"] = USER_AGENT
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+# Stories waiting to be committed and pushed by the background git worker.
+GIT_BATCH_SIZE = 10
+GIT_BATCH_DELAY = 2.0
+_GIT_QUEUE = queue.Queue()
+_GIT_ERRORS = []
+_GIT_PUSHED = threading.Event()
+_WRITE_LOCK = threading.Lock()
+_TERMINAL_LOCK = threading.Lock()
+_git_worker = None
+
+_SLUG_RE = re.compile(r'[^a-z0-9]+')
+_DASH_RUN_RE = re.compile(r'-{2,}')
+# ASCII fast path for slugify: every byte outside [a-z0-9] becomes '-'.
+_SLUG_TABLE = bytes(c if chr(c) in string.ascii_lowercase + string.digits else ord('-') for c in range(256))
+_NAME_RE = re.compile(r'\b[A-Z][a-z]{2,}\b')
+_SENT_RE = re.compile(r'(?<=[.!?]) +')
+_CHAPTER_RE = re.compile(r'(?:Chapter|CHAPTER)\s+\w+')
+_AUTHOR_BRACKET_RE = re.compile(r'\[.*?\]')
+_CHARSET_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+NAME_BLACKLIST = frozenset({"Chapter", "Project", "Gutenberg", "This", "That", "From", "With", "Table", "About", "Above", "Below", "More", "Less", "Other"})
+
+# Word-count upper bounds for each age band; AGE_LABELS has one extra entry
+# for anything at or above the last bound.
+AGE_BOUNDS = (1000, 5000, 15000)
+AGE_LABELS = ("5–8", "6–10", "8–12", "10–14")
+
+DEFAULT_CATEGORY = "Curiosity & Imagination"
+CATEGORY_THEMES = {
+    "Morality & Cautionary Lessons": ["foolish", "wise", "lesson", "moral", "punish"],
+    "Actions & Consequences": ["consequence", "result", "choice", "action", "regret"],
+    "Empathy & Transformation": ["feel", "change", "understand", "kind", "transform"],
+    "Friendship & Loyalty": ["friend", "loyal", "trust", "help", "together"],
+    "Growing Up & Responsibility": ["child", "grow", "responsible", "adult", "learn"],
+    "Curiosity & Imagination": ["dream", "imagine", "wonder", "explore", "magic"]
+}
+
+# One alternation over every keyword with a named group per category, so the
+# text is scanned once. Group "catN" is the Nth category in CATEGORY_THEMES.
+# Keywords are lowercase and matched against lowercased text: re.IGNORECASE
+# turns off sre's literal-prefix search and made this scan ~3x slower. The
+# alternation sits in a lookahead so matches are zero-width and every position
+# is tried; otherwise "growise" would consume "grow" and hide "wise".
+_CATEGORIES = list(CATEGORY_THEMES)
+_CATEGORY_RE = re.compile('(?=' + '|'.join(
+    f"(?P<cat{i}>{'|'.join(map(re.escape, CATEGORY_THEMES[category]))})"
+    for i, category in enumerate(_CATEGORIES)
+) + ')')
 
 def slugify(text):
-    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+    text = text.lower()
+    if not text.isascii():
+        return _SLUG_RE.sub('-', text).strip('-')
+    slug = text.encode('ascii').translate(_SLUG_TABLE).decode('ascii')
+    return _DASH_RUN_RE.sub('-', slug).strip('-')
 
 def estimate_reading_time(word_count):
     wpm = 200
@@ -21,34 +95,25 @@ def estimate_reading_time(word_count):
     return f"~{max(1, minutes)} min"
 
 def detect_age_category(word_count):
-    if word_count < 1000:
-        return "5–8"
-    elif word_count < 5000:
-        return "6–10"
-    elif word_count < 15000:
-        return "8–12"
-    else:
-        return "10–14"
-
-def detect_category(text):
-    themes = {
-        "Morality & Cautionary Lessons": ["foolish", "wise", "lesson", "moral", "punish"],
-        "Actions & Consequences": ["consequence", "result", "choice", "action", "regret"],
-        "Empathy & Transformation": ["feel", "change", "understand", "kind", "transform"],
-        "Friendship & Loyalty": ["friend", "loyal", "trust", "help", "together"],
-        "Growing Up & Responsibility": ["child", "grow", "responsible", "adult", "learn"],
-        "Curiosity & Imagination": ["dream", "imagine", "wonder", "explore", "magic"]
-    }
-    for category, keywords in themes.items():
-        if any(word in text.lower() for word in keywords):
-            return category
-    return "Curiosity & Imagination"
+    return AGE_LABELS[bisect_right(AGE_BOUNDS, word_count)]
+
+def detect_category(text, text_lower=None):
+    if text_lower is None:
+        text_lower = text.lower()
+    best = None
+    for match in _CATEGORY_RE.finditer(text_lower):
+        # Earlier categories take priority regardless of where they match.
+        rank = int(match.lastgroup[3:])
+        if best is None or rank < best:
+            best = rank
+            if best == 0:
+                break
+    if best is None:
+        return DEFAULT_CATEGORY
+    return _CATEGORIES[best]
 
 def extract_characters(text):
-    words = re.findall(r'\b[A-Z][a-z]{2,}\b', text)
-    blacklist = {"Chapter", "Project", "Gutenberg", "This", "That", "From", "With", "Table", "About", "Above", "Below", "More", "Less", "Other"}
-    filtered = [word for word in words if word not in blacklist]
-    freq = Counter(filtered)
+    freq = Counter(name for match in _NAME_RE.finditer(text) if (name := match.group()) not in NAME_BLACKLIST)
     top_names = [name for name, count in freq.most_common(10) if count > 2]
     characters = [{
         "name": name,
@@ -60,34 +125,104 @@ def get_cover_image(url):
     base_url = url.rsplit('/', 1)[0]
     return base_url + "/images/cover.jpg"
 
+def cover_image_exists(cover_url):
+    # Only a definite "not found" drops the cover; a timeout or other error on
+    # the check keeps the synthesised URL rather than writing null for good.
+    try:
+        response = _SESSION.head(cover_url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+    except requests.RequestException:
+        return True
+    return response.status_code not in (404, 410)
+
 def clean_title(raw_title):
     title = raw_title.replace("The Project Gutenberg eBook of", "").split(", by")[0].strip()
     return title
 
 def clean_author(raw_author):
     author = raw_author.replace("by", "").strip()
-    author = re.sub(r"\[.*?\]", "", author).strip()
+    author = _AUTHOR_BRACKET_RE.sub("", author).strip()
     return author
 
+def declared_encoding(response):
+    # Only trust a charset the server actually sent; response.encoding falls
+    # back to ISO-8859-1 for any text/* type, which is wrong for Gutenberg.
+    # Unknown names are ignored so the parsers fall back to sniffing.
+    match = _CHARSET_RE.search(response.headers.get("Content-Type", ""))
+    if not match:
+        return None
+    try:
+        codecs.lookup(match.group(1))
+    except LookupError:
+        return None
+    return match.group(1)
+
+def extract_text(content, encoding=None):
+    # Same text as soup.get_text(separator=' ', strip=True), but in one
+    # C-level pass over an lxml tree instead of walking a BeautifulSoup tree.
+    # Words are counted per text node on the way, which equals
+    # len(text.split()) without materialising a list of every word in the book.
+    parser = html.HTMLParser(encoding=encoding) if encoding else None
+    try:
+        tree = html.fromstring(content, parser=parser)
+    except etree.ParserError:
+        # Empty or whitespace-only body: no text, like get_text() on an empty soup.
+        return '', 0
+    etree.strip_elements(tree, etree.Comment, 'script', 'style', with_tail=False)
+    pieces = [piece for piece in (s.strip() for s in tree.itertext()) if piece]
+    word_count = sum(len(piece.split()) for piece in pieces)
+    return ' '.join(pieces), word_count
+
+def iter_sentences(text):
+    # Lazy equivalent of _SENT_RE.split(text), so callers that stop early
+    # never scan or copy the rest of a long book.
+    start = 0
+    for match in _SENT_RE.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
 def generate_summary(text):
-    sentences = re.split(r'(?<=[.!?]) +', text)
-    for sentence in sentences:
+    for sentence in iter_sentences(text):
         if len(sentence.split()) > 6:
             return sentence.strip()
     return "A story about imagination, adventure, and transformation."
 
-def parse_gutenberg_html(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+def split_chapters(text):
+    chapters = {}
+    # Pair each heading with the next one (None after the last) so chapter
+    # bounds come straight off the iterator without listing every match.
+    for match, next_match in pairwise(chain(_CHAPTER_RE.finditer(text), [None])):
+        end = next_match.start() if next_match else len(text)
+        chapters[match.group(0).strip()] = text[match.start():end].strip()
+    if not chapters:
+        chapters["Full Story"] = text
+    return chapters
 
-    raw_title = soup.find('title').text.strip()
-    raw_author = soup.find('h2').text.strip() if soup.find('h2') else "Unknown"
+def parse_gutenberg_html(url):
+    # The cover check is independent of the page, so let it run in the
+    # background while the HTML is fetched and parsed.
+    cover_url = get_cover_image(url)
+    cover_check = _EXECUTOR.submit(cover_image_exists, cover_url)
+
+    response = _SESSION.get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    encoding = declared_encoding(response)
+    soup = BeautifulSoup(
+        response.content, 'lxml',
+        parse_only=SoupStrainer(['title', 'h2']),
+        from_encoding=encoding,
+    )
+
+    title_tag = soup.find('title')
+    raw_title = title_tag.text.strip() if title_tag else ""
+    h2 = soup.find('h2')
+    raw_author = h2.text.strip() if h2 else "Unknown"
 
     title = clean_title(raw_title)
     author = clean_author(raw_author)
 
-    raw_text = soup.get_text(separator=' ', strip=True)
-    word_count = len(raw_text.split())
+    raw_text, word_count = extract_text(response.content, encoding)
+    raw_lower = raw_text.lower()
 
     summary = generate_summary(raw_text)
 
@@ -95,8 +230,8 @@ def parse_gutenberg_html(url):
         "title": title,
         "author": author,
         "year": datetime.now().year,
-        "category": detect_category(raw_text),
-        "cover_image": get_cover_image(url),
+        "category": detect_category(raw_text, raw_lower),
+        "cover_image": cover_url if cover_check.result() else None,
         "link": url,
         "summary": summary,
         "reading_time": estimate_reading_time(word_count),
@@ -104,50 +239,123 @@ def parse_gutenberg_html(url):
         "characters": extract_characters(raw_text),
     }
 
-    chapters = {}
-    matches = list(re.finditer(r'(Chapter\s+\w+|CHAPTER\s+\w+)', raw_text))
-    if matches:
-        for i, match in enumerate(matches):
-            start = match.start()
-            end = matches[i + 1].start() if i + 1 < len(matches) else len(raw_text)
-            ch_title = match.group(0).strip()
-            chapters[ch_title] = raw_text[start:end].strip()
-    else:
-        chapters["Full Story"] = raw_text
-
-    return story_data, chapters
+    return story_data, split_chapters(raw_text)
 
 def load_library():
     if not os.path.exists(LIBRARY_PATH):
         return []
-    with open(LIBRARY_PATH, "r") as f:
-        return json.load(f)
+    with open(LIBRARY_PATH, "rb") as f:
+        return orjson.loads(f.read())
+
+def index_library(library):
+    index = {}
+    for i, entry in enumerate(library):
+        index.setdefault(entry["link"], i)
+    return index
+
+def write_json(path, data):
+    # Write to a sibling temp file, fsync it and swap it in, so a crash or
+    # power loss mid-write never leaves a truncated JSON file behind.
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def save_library(library):
-    with open(LIBRARY_PATH, "w") as f:
-        json.dump(library, f, indent=2)
+    write_json(LIBRARY_PATH, library)
+
+def story_path(slug):
+    return os.path.join(CONTENT_DIR, f"{slug}.json")
 
 def save_story(slug, content):
     os.makedirs(CONTENT_DIR, exist_ok=True)
-    with open(os.path.join(CONTENT_DIR, f"{slug}.json"), "w") as f:
-        json.dump(content, f, indent=2)
-
-def commit_and_push(title):
-    subprocess.run(["git", "add", "."], check=True)
-    subprocess.run(["git", "commit", "-m", f"Added/Updated story: {title}"], check=True)
+    write_json(story_path(slug), content)
+
+def commit_and_push(stories):
+    # Stage and commit only the files this run wrote, rather than `git add .`
+    # walking the whole work tree and sweeping up unrelated changes.
+    # `git commit -- <paths>` commits the work-tree copies, not the index, so
+    # the lock has to cover the commit as well as the add.
+    with _WRITE_LOCK:
+        # Stories are queued under this lock right after their files are
+        # written, so anything already in library.json is in the queue by now.
+        # Pull those into this batch so the commit includes their content files.
+        # `stories` is extended in place so the worker's task_done count and
+        # error report cover them too.
+        while True:
+            try:
+                stories.append(_GIT_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        titles = list(dict.fromkeys(title for title, _ in stories))
+        paths = list(dict.fromkeys([LIBRARY_PATH, *(story_path(slug) for _, slug in stories)]))
+        if len(titles) == 1:
+            message = f"Added/Updated story: {titles[0]}"
+        else:
+            message = f"Added/Updated stories: {', '.join(titles)}"
+        subprocess.run(["git", "add", "--", *paths], check=True)
+        unchanged = subprocess.run(["git", "diff", "--cached", "--quiet", "--", *paths]).returncode == 0
+        if unchanged:
+            print(f"ℹ️ No changes to commit for: {', '.join(titles)}")
+            return False
+        subprocess.run(["git", "commit", "-m", message, "--", *paths], check=True)
     subprocess.run(["git", "push"], check=True)
-
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--url', type=str, required=True, help='Gutenberg story URL')
-    args = parser.parse_args()
-    url = args.url
-
-    library = load_library()
-    existing_index = next((i for i, entry in enumerate(library) if entry["link"] == url), None)
+    return True
+
+def _commit_worker():
+    # Wait for one story, then keep collecting until the queue goes quiet for
+    # GIT_BATCH_DELAY seconds or GIT_BATCH_SIZE stories are waiting, and
+    # publish the whole batch with a single add/commit/push.
+    while True:
+        batch = [_GIT_QUEUE.get()]
+        while len(batch) < GIT_BATCH_SIZE:
+            try:
+                batch.append(_GIT_QUEUE.get(timeout=GIT_BATCH_DELAY))
+            except queue.Empty:
+                break
+        try:
+            with _TERMINAL_LOCK:
+                if commit_and_push(batch):
+                    _GIT_PUSHED.set()
+        except Exception as e:
+            _GIT_ERRORS.append(([title for title, _ in batch], e))
+        finally:
+            for _ in batch:
+                _GIT_QUEUE.task_done()
+
+def queue_commit(title, slug):
+    global _git_worker
+    if _git_worker is None:
+        _git_worker = threading.Thread(target=_commit_worker, daemon=True)
+        _git_worker.start()
+    _GIT_QUEUE.put((title, slug))
+
+def flush_commits():
+    _GIT_QUEUE.join()
+    if _GIT_ERRORS:
+        errors = _GIT_ERRORS[:]
+        _GIT_ERRORS.clear()
+        for titles, error in errors:
+            print(f"❌ Git failed for {', '.join(titles)}: {error}")
+        failed = [title for titles, _ in errors for title in titles]
+        raise RuntimeError(f"Saved locally but not pushed: {', '.join(failed)}") from errors[0][1]
+
+def add_story(url, library, index):
+    existing_index = index.get(url)
 
     if existing_index is not None:
-        choice = input("⚠️ This story already exists. Do you want to overwrite it? (y/n): ").strip().lower()
+        # Hold off the git worker so its output or a credential prompt can't
+        # land in the middle of this question.
+        with _TERMINAL_LOCK:
+            choice = input("⚠️ This story already exists. Do you want to overwrite it? (y/n): ").strip().lower()
         if choice != 'y':
             print("❌ Cancelled. Please enter a new URL.")
             return
@@ -165,16 +373,42 @@ def main():
     print(f"👤 Characters: {[c['name'] for c in metadata['characters']]}")
     print(f"🧠 Age category: {metadata['age_category']}")
 
-    save_story(slug, content)
-
     if existing_index is not None:
         library[existing_index] = metadata
     else:
+        index[url] = len(library)
         library.append(metadata)
 
-    save_library(library)
-    commit_and_push(metadata["title"])
-    print("✅ Story saved and pushed to GitHub.")
+    # Keep the story file and library entry in step with what the background
+    # committer stages.
+    with _WRITE_LOCK:
+        save_story(slug, content)
+        save_library(library)
+        queue_commit(metadata["title"], slug)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', type=str, action='append', required=True,
+                        help='Gutenberg story URL (repeat to add several stories)')
+    args = parser.parse_args()
+
+    library = load_library()
+    index = index_library(library)
+    completed = False
+    try:
+        for url in args.url:
+            add_story(url, library, index)
+        completed = True
+    finally:
+        # Publish whatever was already queued even if a later URL failed or
+        # the user hit Ctrl-C; the worker is a daemon thread and would
+        # otherwise die with the interpreter.
+        if _git_worker is not None:
+            print("⏳ Pushing to GitHub...")
+            flush_commits()
+
+    if completed and _GIT_PUSHED.is_set():
+        print("✅ Saved stories pushed to GitHub.")
 
 if __name__ == "__main__":
     main()